@@ -9,21 +9,282 @@
 
 # Example script showing basic library usage - updating key images with new
 # tiles generated at runtime, and responding to button state change events.
-
+#
+# The "action" of a key in the config is a command that is run when the key is
+# pressed. Simple commands (a program and its arguments, with optional quoting
+# and a leading "~" for the user's home directory) are run directly. Commands
+# that use any other shell syntax, such as "&&", "|", ";", "$", redirections,
+# globs ("*", "?", "[...]", "{...}"), "VAR=value" assignments, "!", "#" or
+# multiple lines, are run through the shell instead. So are commands with
+# unbalanced quotes, and commands that combine quoting with a "~".
+
+import concurrent.futures
+import copy
+import functools
+import logging
 import os
+import shlex
+import signal
 import threading
 import json
 import sys
 import subprocess
 
+# Use the faster orjson parser for the config file when it is available,
+# falling back to the standard library json module otherwise.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from PIL import Image, ImageDraw, ImageFont
 from StreamDeck.DeviceManager import DeviceManager
 from StreamDeck.ImageHelpers import PILHelper
 
+log = logging.getLogger(__name__)
+
+# Log level for the application, set to logging.DEBUG to log each key event.
+LOG_LEVEL = logging.WARNING
+
 # Folder location of image assets used by this example.
 ASSETS_PATH = os.path.join(os.path.dirname(__file__), "Assets")
 CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config.json")
-CURRENT_PAGE = 1
+KEY_FONT_PATH = os.path.join(ASSETS_PATH, "Roboto-Regular.ttf")
+
+# Characters that indicate a key action uses shell syntax, and so must be run
+# through the shell rather than directly, see prepare_key_actions().
+SHELL_METACHARACTERS = set("&|;<>()$`*?[]{}!=#\n")
+
+# Characters that quote or escape part of a key action. A "~" is only expanded
+# by the shell when it isn't quoted, so actions that contain both are also run
+# through the shell, see prepare_key_actions().
+SHELL_QUOTE_CHARACTERS = set("'\"\\")
+
+# Number of worker threads used to render key images in parallel.
+RENDER_WORKERS = 4
+
+# Worker threads used to render key images in parallel. These are kept for the
+# lifetime of the application, so that each worker's reusable key image (see
+# get_work_image()) survives between renders.
+RENDER_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=RENDER_WORKERS)
+
+# Key count and image format of each open deck, see cache_deck_info().
+DECK_INFO = {}
+
+# Decoded icon images, see load_icon().
+ICON_CACHE = {}
+
+# Rendered key label masks and their offsets, see get_label_mask().
+LABEL_CACHE = {}
+
+# Reusable key images for each rendering thread, see get_work_image().
+WORK_IMAGES = threading.local()
+
+# Rendered native format key images, see get_key_image().
+KEY_IMAGE_CACHE = {}
+
+# Config of each open deck, see load_deck_config().
+DECK_CONFIGS = {}
+
+# Set to request that the application shuts down, closing all the decks.
+SHUTDOWN = threading.Event()
+
+# Stores the key count and image format of the given deck, which are constant
+# for the lifetime of the deck object, so they don't need to be requested from
+# the deck each time a key is updated.
+def cache_deck_info(deck):
+    image_format = deck.key_image_format()
+
+    DECK_INFO[deck] = {
+        "key_count": deck.key_count(),
+        "image_size": image_format["size"],
+        "image_format_key": (image_format["size"], image_format["format"], image_format["flip"], image_format["rotation"]),
+    }
+
+# Loads and parses the JSON config file at the given location.
+def load_config(config_path):
+    with open(config_path, 'rb') as config_file:
+        config_data = config_file.read()
+
+    if orjson:
+        return orjson.loads(config_data)
+
+    return json.loads(config_data)
+
+# Prepares a copy of the given config for use with the given deck. Each deck has
+# its own copy, as the active state of each key is stored within its config.
+def load_deck_config(deck, config):
+    pages = copy.deepcopy(config["pages"])
+    page_index = {p["page_number"]: {k["button"]: k for k in p["keys"]} for p in pages} # Key configs, indexed by page number and then button.
+
+    prepare_key_actions(page_index) # Split all the key actions into their program arguments.
+    normalize_key_icons(page_index) # Convert all the key icon filenames to full paths.
+    prepare_key_styles(page_index) # Build the style selectors used to change the state of each key.
+
+    home_page = next(p for p in pages if p.get("home_page")) # Get the layout of the intial home screen.
+
+    DECK_CONFIGS[deck] = {
+        "pages_by_number": {p["page_number"]: p for p in pages}, # Page configs, indexed by page number.
+        "page_index": page_index,
+        "home_page": home_page["page_number"],
+        "current_page": home_page["page_number"],
+    }
+
+# Requests that the application shuts down when it receives a termination
+# signal, so that the main thread can reset and close all the decks.
+def shutdown_signal_handler(signum, frame):
+    SHUTDOWN.set()
+
+# Loads a TrueType font, caching the result so that the font file is only
+# parsed once for each filename/size combination.
+@functools.lru_cache(maxsize=32)
+def _load_font(font_filename, size):
+    return ImageFont.truetype(font_filename, size)
+
+# Returns the decoded image for an icon file, only reading and decoding the file
+# the first time it is requested. The returned image is shared, and must not be
+# modified by the caller.
+def load_icon(icon_filename):
+    icon = ICON_CACHE.get(icon_filename)
+    if icon is None:
+        icon = Image.open(icon_filename)
+        icon.load()
+        ICON_CACHE[icon_filename] = icon
+
+    return icon
+
+# Converts the icon filenames of each key in the given key config index to full
+# paths up front, so that they can be compared and loaded without any further
+# path manipulation. Relative filenames are taken to be within the assets folder.
+def normalize_key_icons(page_index):
+    for page_keys in page_index.values():
+        for key_config in page_keys.values():
+            for icon_type in ["primary_icon", "secondary_icon", "active_icon"]:
+                icon = key_config.get(icon_type)
+                if icon:
+                    key_config[icon_type] = os.path.join(ASSETS_PATH, icon)
+
+# Builds a function for the given key config, which returns the icon and label
+# the key should show for a new key state. The decision of which icons and
+# labels to use (and their fallbacks) is made once here, rather than each time
+# the key changes state.
+def build_key_style_selector(key_config):
+    primary_icon = key_config.get("primary_icon", '')
+    primary_label = key_config.get("primary_label", '')
+
+    # Keys fall back to their primary icon/label for any state that doesn't specify its own.
+    # This forces us to NEVER change the label if we don't specify one for the secondary state. Can we improve this?
+    primary_style = (primary_icon, primary_label)
+    secondary_style = (key_config.get("secondary_icon", '') or primary_icon, key_config.get("secondary_label", '') or primary_label)
+
+    def active_style():
+        return (key_config.get("active_icon", '') or primary_icon, key_config.get("active_label", '') or primary_label)
+
+    if key_config.get('toggle', None):
+        # When a toggle button is pressed, invert the icon based on the active icon.
+        def next_style(state):
+            if not state:
+                return active_style()
+
+            if key_config.get("active_icon") == primary_icon:
+                return secondary_style
+
+            return primary_style
+    else:
+        def next_style(state):
+            if not state:
+                return primary_style
+
+            return active_style()
+
+    return next_style
+
+# Builds the style selector function of each key in the given key config index,
+# see build_key_style_selector().
+def prepare_key_styles(page_index):
+    for page_keys in page_index.values():
+        for key_config in page_keys.values():
+            key_config["_next_style"] = build_key_style_selector(key_config)
+
+# Decodes all the icons referenced by the given key config index up front, so
+# that key presses don't need to read image files from disk.
+def preload_icons(page_index):
+    for page_keys in page_index.values():
+        for key_config in page_keys.values():
+            for icon_type in ["primary_icon", "secondary_icon", "active_icon"]:
+                icon = key_config.get(icon_type)
+                if icon:
+                    try:
+                        load_icon(icon)
+                    except OSError as e:
+                        log.warning("Failed to load icon %s: %s", icon, e)
+
+# Splits the action command of each key in the given key config index into its
+# program arguments up front, so that simple actions can be run directly without
+# spawning a shell on each key press. As no shell is used, a leading "~" in an
+# argument is expanded to the user's home directory here instead. Actions that
+# use any other shell syntax are kept as-is, to be run through the shell.
+def prepare_key_actions(page_index):
+    for page_keys in page_index.values():
+        for key_config in page_keys.values():
+            action = key_config.get("action", None)
+            if not action:
+                continue
+
+            key_config["_action_argv"] = action
+            key_config["_action_shell"] = True
+
+            if any(c in SHELL_METACHARACTERS for c in action):
+                continue
+
+            if "~" in action and any(c in SHELL_QUOTE_CHARACTERS for c in action):
+                continue
+
+            # Leave actions with unbalanced quotes to the shell, which will
+            # report the error when the key is pressed.
+            try:
+                action_argv = shlex.split(action)
+            except ValueError:
+                continue
+
+            key_config["_action_argv"] = [os.path.expanduser(arg) for arg in action_argv]
+            key_config["_action_shell"] = False
+
+# Returns a mask image of the given label text drawn in the given font, along
+# with the offset of its top left corner from the label's middle baseline
+# anchor point. Each label is only drawn the first time it is requested.
+def get_label_mask(font_filename, label_text):
+    cache_key = (font_filename, label_text)
+
+    label = LABEL_CACHE.get(cache_key)
+    if label is None:
+        # Load a custom TrueType font, and draw the label into a mask that is
+        # just large enough to hold it.
+        font = _load_font(font_filename, 14)
+        left, top, right, bottom = font.getbbox(label_text, anchor="ms")
+
+        label_mask = Image.new("L", (right - left, bottom - top))
+        ImageDraw.Draw(label_mask).text((-left, -top), text=label_text, font=font, anchor="ms", fill=255)
+
+        label = (label_mask, (left, top))
+        LABEL_CACHE[cache_key] = label
+
+    return label
+
+# Returns a blank key image for the given deck that can be drawn into by the
+# calling thread. The same image is reused by each thread, to avoid allocating
+# a new one for every key that is rendered.
+def get_work_image(deck):
+    image_size = DECK_INFO[deck]["image_size"]
+
+    image = getattr(WORK_IMAGES, "image", None)
+    if image is None or image.size != image_size:
+        image = PILHelper.create_image(deck)
+        WORK_IMAGES.image = image
+    else:
+        image.paste("black", (0, 0) + image.size)
+
+    return image
 
 # Generates a custom tile with run-time generated text and custom image via the
 # PIL module.
@@ -31,23 +292,70 @@ def render_key_image(deck, icon_filename, font_filename, label_text):
     # Resize the source image asset to best-fit the dimensions of a single key,
     # leaving a margin at the bottom so that we can draw the key title
     # afterwards.
-    icon = Image.open(icon_filename)
+    icon = load_icon(icon_filename)
 
     margin = 0
 
     if label_text:
         margin = 20
 
-    image = PILHelper.create_scaled_image(deck, icon, margins=[0, 0, margin, 0])
+    image = get_work_image(deck)
+    PILHelper.paste_scaled_image(image, icon, margins=[0, 0, margin, 0])
 
-    # Load a custom TrueType font and use it to overlay the key index, draw key
-    # label onto the image a few pixels from the bottom of the key.
-    draw = ImageDraw.Draw(image)
-    font = ImageFont.truetype(font_filename, 14)
-    draw.text((image.width / 2, image.height - 5), text=label_text, font=font, anchor="ms", fill="white")
+    # Overlay the key label onto the image a few pixels from the bottom of the
+    # key, using a custom TrueType font.
+    if label_text:
+        label_mask, (label_x, label_y) = get_label_mask(font_filename, label_text)
+        image.paste("white", (image.width // 2 + label_x, image.height - 5 + label_y), label_mask)
 
+    # The library's conversion helper reads the image format from the deck itself
+    # rather than from DECK_INFO. As keys are only rendered on a cache miss (i.e.
+    # during the prerender pass at startup) this isn't on the key press path.
     return PILHelper.to_native_format(deck, image)
 
+# Returns the already rendered native format key image for the given icon, font
+# and label, or `None` if it hasn't been rendered yet, see get_key_image().
+def get_cached_key_image(deck, icon_filename, font_filename, label_text):
+    return KEY_IMAGE_CACHE.get(DECK_INFO[deck]["image_format_key"] + (icon_filename, font_filename, label_text))
+
+# Returns a native format key image for the given icon, font and label,
+# rendering it only the first time a particular combination is requested for
+# a given deck image format. If the key image can't be rendered (e.g. due to a
+# missing icon file) the error is logged and `None` is returned, so that only
+# the affected key is left blank.
+def get_key_image(deck, icon_filename, font_filename, label_text):
+    cache_key = DECK_INFO[deck]["image_format_key"] + (icon_filename, font_filename, label_text)
+
+    image = KEY_IMAGE_CACHE.get(cache_key)
+    if image is None:
+        try:
+            image = render_key_image(deck, icon_filename, font_filename, label_text)
+        except OSError as e:
+            log.warning("Failed to render key image for icon %s: %s", icon_filename, e)
+            return None
+
+        KEY_IMAGE_CACHE[cache_key] = image
+
+    return image
+
+# Renders the key images for every icon and label combination used by the given
+# key config index up front, so that page loads and key presses only need to
+# upload the cached images to the deck.
+def prerender_key_images(deck, page_index):
+    key_styles = set()
+
+    for page_keys in page_index.values():
+        for key_config in page_keys.values():
+            for (icon_type, label_type) in [("primary_icon", "primary_label"), ("secondary_icon", "secondary_label"), ("active_icon", "active_label")]:
+                # Same fallback to the primary icon/label as used in build_key_style_selector().
+                icon = key_config.get(icon_type, '') or key_config.get("primary_icon", '')
+                label = key_config.get(label_type, '') or key_config.get("primary_label", '')
+
+                if icon:
+                    key_styles.add((icon, label))
+
+    list(RENDER_EXECUTOR.map(lambda ks: get_key_image(deck, ks[0], KEY_FONT_PATH, ks[1]), key_styles))
+
 # Returns the current styling information for a key. Readonly.
 def get_current_key_style(deck, page_number, key, state):
 
@@ -63,84 +371,23 @@ def get_current_key_style(deck, page_number, key, state):
 
 # Returns styling information for a key based on its position and state.
 def get_key_style(deck, page_number, key, state):
-    # Last button in the example application is the exit button.
-    exit_key_index = deck.key_count() - 1
-
-    font = "Roboto-Regular.ttf"
-    font_location = os.path.join(ASSETS_PATH, font)
-
-    name = "Button" + str(key)
-
      # Get the config for the individual key
     key_config = get_key_config(deck, page_number, key)
     if not key_config:
         return {}
 
-    icon_type = ''
-    label_type = ''
-
-    toggle_key = key_config.get('toggle', None)
-
-
-    if toggle_key:
-        icon_type = "active_icon"
-        label_type = "active_label"
-        
-        # When a button is pressed, invert the icon.
-        if state == True:
-            # Collect current values
-            primary_icon = key_config["primary_icon"]
-            primary_label = key_config.get("primary_label", '')
-            secondary_icon = key_config["secondary_icon"]
-            secondary_label = key_config.get("secondary_label", '')
-            active_icon = key_config["active_icon"]
-            active_label = key_config["active_label"]
-
-            # Calculate the new state of the icon based on the active icon. Handles both FQDN and plain filenames.
-            if active_icon == primary_icon or active_icon == os.path.join(ASSETS_PATH, primary_icon):
-                icon_type = 'secondary_icon'
-                label_type = 'secondary_label'
-            else:
-                icon_type = 'primary_icon'
-                label_type = 'primary_label'
-    else:
-        if state == True:
-            icon_type = "active_icon"
-            label_type = "active_label"
-        else: 
-            icon_type = "primary_icon"
-            label_type = "primary_label"
-
-    icon = ''
-    label = ''
-
-    if key_config:
-        icon = key_config.get(icon_type, '') or key_config.get("primary_icon", '')
-        label = key_config.get(label_type, '') or key_config.get("primary_label", '') # This line forces us to NEVER change the label if we don't specify one for the secondary state. Can we improve this?
-
-    icon_location = ''
-    if icon:
-        icon_location = os.path.join(ASSETS_PATH, icon)
-
+    icon, label = key_config["_next_style"](state)
 
     return {
-        "name": name,
-        "icon": icon_location,
-        "font": font_location,
+        "name": "Button" + str(key),
+        "icon": icon,
+        "font": KEY_FONT_PATH,
         "label": label
     }
 
 # returns the config value for an entry matching the specified key, from the config file.
 def get_key_config(deck, page_number, key):
-    
-    page = [p for p in PAGES if p["page_number"] == page_number][0]
-
-    # Filter the array of key configs to just the one we are interested in.
-    matching_key_configs = [k for k in page["keys"] if k["button"] == key]
-
-    if matching_key_configs:
-       key_config = matching_key_configs[0]
-       return key_config
+    return DECK_CONFIGS[deck]["page_index"].get(page_number, {}).get(key)
 
 # sets the config value for an entry matching the specified key/config value.
 def set_key_config_value(deck, page_number, key, config_item, value):
@@ -155,15 +402,23 @@ def set_key_config_value(deck, page_number, key, config_item, value):
 # and updates the image on the StreamDeck.
 def update_key_image(deck, page_number, key, state):
 
-    print("update_key_image | Updating: page", page_number, " key ", key)
+    log.debug("update_key_image | Updating: page %s key %s", page_number, key)
 
     # Determine what icon and label to use on the generated key.
     key_style = get_key_style(deck, page_number, key, state)
 
     if key_style and key_style["icon"]:
 
+        # Skip the update if the key is already showing the requested icon and
+        # label, as there is nothing to render or upload to the deck.
+        key_config = get_key_config(deck, page_number, key)
+        if key_config.get("active_icon") == key_style["icon"] and key_config.get("active_label") == key_style["label"]:
+            return
+
         # Generate the custom key with the requested image and label.
-        image = render_key_image(deck, key_style["icon"], key_style["font"], key_style["label"])
+        image = get_key_image(deck, key_style["icon"], key_style["font"], key_style["label"])
+        if image is None:
+            return
 
         # Use a scoped-with on the deck to ensure we're the only thread using it
         # right now.
@@ -171,9 +426,12 @@ def update_key_image(deck, page_number, key, state):
             # Update requested key with the generated image.
             deck.set_key_image(key, image)
 
-        # Update the active elements in the config to reflect the new state of the key.
-        set_key_config_value(deck, page_number, key, "active_icon", key_style["icon"])
-        set_key_config_value(deck, page_number, key, "active_label", key_style["label"])
+        set_active_key_style(deck, page_number, key, key_style)
+
+# Updates the active elements in the config to reflect the new state of a key.
+def set_active_key_style(deck, page_number, key, key_style):
+    set_key_config_value(deck, page_number, key, "active_icon", key_style["icon"])
+    set_key_config_value(deck, page_number, key, "active_label", key_style["label"])
 
 # Performs any configured actions for a button when it has been pressed.
 def perform_key_actions(deck, page_number, key, state):
@@ -184,100 +442,161 @@ def perform_key_actions(deck, page_number, key, state):
         if key_config:
             display_page = key_config.get("display_page", None)
             if display_page:
-                print('Changing display to page: ', display_page)
+                log.debug("Changing display to page: %s", display_page)
                 load_page(deck, display_page)
-                
-                global CURRENT_PAGE
-                CURRENT_PAGE = display_page
 
-            action = key_config.get("action", None)
-            if action:
-                print('Performing action on key: ', key)
-                subprocess.Popen(action, shell=True)
+            action_argv = key_config.get("_action_argv", None)
+            if action_argv:
+                log.debug("Performing action on key: %s", key)
+
+                # Start the action without waiting for it to complete, so that
+                # further key events can be processed while it runs. Finished
+                # processes are reaped automatically by the subprocess module.
+                try:
+                    subprocess.Popen(action_argv, shell=key_config["_action_shell"], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+                except OSError as e:
+                    log.warning("Failed to perform action on key %s: %s", key, e)
 
 # Loads the keys for a specified page onto the Streamdeck.
 def load_page(deck, page_number):
-    page_layout = [p for p in PAGES if p["page_number"] == page_number][0] # Get the config for all the buttons on the specified page.
+    page_layout = DECK_CONFIGS[deck]["pages_by_number"].get(page_number) # Get the config for all the buttons on the specified page.
 
     # Update key images.
     if page_layout:
-        deck.clear() # Reset the deck, clearing all current images.
+        log.debug("load_page | Loading: page %s", page_layout["page_number"])
+
+        # Determine what icon and label to use on each key of the new page.
+        key_styles = [(key["button"], get_key_style(deck, page_layout["page_number"], key["button"], False)) for key in page_layout["keys"]]
+        key_styles = [(key, key_style) for (key, key_style) in key_styles if key_style and key_style["icon"]]
+
+        # Look up the already rendered key images, and generate any missing ones
+        # in parallel so that the rendering of each key can overlap with the
+        # others. All the images used by the config are normally prerendered, so
+        # this only needs the render workers if a key image can't be found.
+        key_images = {}
+        missing_key_styles = []
+
+        for (key, key_style) in key_styles:
+            image = get_cached_key_image(deck, key_style["icon"], key_style["font"], key_style["label"])
+            if image is not None:
+                key_images[key] = image
+            else:
+                missing_key_styles.append((key, key_style))
+
+        if missing_key_styles:
+            images = RENDER_EXECUTOR.map(lambda ks: get_key_image(deck, ks[1]["icon"], ks[1]["font"], ks[1]["label"]), missing_key_styles)
+            key_images.update({key: image for (key, key_style), image in zip(missing_key_styles, images)})
 
-        for key in page_layout["keys"]:
-            update_key_image(deck, page_layout["page_number"], key["button"], False) # Update images to display the new page.
-        
-        global CURRENT_PAGE
-        CURRENT_PAGE = page_layout.get("page_number", 'N/A')
+        # Use a scoped-with on the deck to ensure we're the only thread using it
+        # right now, while we update all the keys in a single batch. Keys with no
+        # image on the new page are cleared, so each key is only written once.
+        with deck:
+            for key in range(DECK_INFO[deck]["key_count"]):
+                deck.set_key_image(key, key_images.get(key))
 
+        # Only keys that were given an image are now showing their new style, any
+        # key that failed to render was cleared instead.
+        for (key, key_style) in key_styles:
+            if key_images.get(key) is not None:
+                set_active_key_style(deck, page_layout["page_number"], key, key_style)
 
-# Prints key state change information, updates the key image and performs any
+        DECK_CONFIGS[deck]["current_page"] = page_layout["page_number"]
+
+
+# Logs key state change information, updates the key image and performs any
 # associated actions when a key is pressed.
 def key_change_callback(deck, key, state):
-    # Print new key state
-    print("BUTTON STATE CHANGE DETECTED: Deck {} Key {} = {}".format(deck.id(), key, state), flush=True)
+    # Log new key state
+    log.debug("BUTTON STATE CHANGE DETECTED: Deck %s Key %s = %s", deck.id(), key, state)
 
     # Check if the key is changing to the pressed state.
     if state:
+        current_page = DECK_CONFIGS[deck]["current_page"]
 
         # Update the key image based on the new key state.
-        update_key_image(deck, CURRENT_PAGE, key, state)
+        update_key_image(deck, current_page, key, state)
 
         # Perform any actions assigned to the key currently only supports 
         # actions on button press, and not when a button released.
-        perform_key_actions(deck, CURRENT_PAGE, key, state)
+        perform_key_actions(deck, current_page, key, state)
 
-        key_style = get_current_key_style(deck, CURRENT_PAGE, key, state)
+        key_style = get_current_key_style(deck, current_page, key, state)
 
-        # # When an exit button is pressed, close the application.
+        # # When an exit button is pressed, close the application. The main
+        # # thread resets and closes all the decks once shutdown is requested.
         # if key_style.get("button") == 14:
-        #     # Use a scoped-with on the deck to ensure we're the only thread
-        #     # using it right now.
-        #     with deck:
-        #         # Reset deck, clearing all button images.
-        #         deck.reset()
-
-        #         # Close deck handle, terminating internal worker threads.
-        #         deck.close()
+        #     SHUTDOWN.set()
 
 
 if __name__ == "__main__":
+    logging.basicConfig(level=LOG_LEVEL)
+
+    # Check for a user specified config file.
+    if len(sys.argv) > 1:
+        if sys.argv[1] == "-c" or sys.argv[1] == "--config":
+            CONFIG_PATH = sys.argv[2]
+
+    DECK_CONFIG = load_config(CONFIG_PATH)
+
     streamdecks = DeviceManager().enumerate()
 
     print("Found {} Stream Deck(s).\n".format(len(streamdecks)))
 
-    for index, deck in enumerate(streamdecks):
-        # This example only works with devices that have screens.
-        if not deck.is_visual():
-            continue
+    # Request a shutdown when the application is interrupted or terminated.
+    signal.signal(signal.SIGINT, shutdown_signal_handler)
+    signal.signal(signal.SIGTERM, shutdown_signal_handler)
 
-        deck.open()
-        deck.reset()
+    open_decks = []
 
-        print("Opened '{}' device (serial number: '{}', fw: '{}')".format(
-            deck.deck_type(), deck.get_serial_number(), deck.get_firmware_version()
-        ))
+    # Always reset and close any opened decks on exit, even if setting up one of
+    # the decks fails.
+    try:
+        for index, deck in enumerate(streamdecks):
+            # Stop setting up decks if a shutdown was requested part way through.
+            if SHUTDOWN.is_set():
+                break
 
-        # Set initial screen brightness to 30%.
-        deck.set_brightness(30)
+            # This example only works with devices that have screens.
+            if not deck.is_visual():
+                continue
 
-        # Check for a user specified config file.
-        if len(sys.argv) > 1:
-            if sys.argv[1] == "-c" or sys.argv[1] == "--config":
-                CONFIG_PATH = sys.argv[2]
-        
-        DECK_CONFIG = json.load(open(CONFIG_PATH, 'r'))
-        PAGES = DECK_CONFIG["pages"]
-        HOME_PAGE = [p for p in PAGES if p["home_page"] == True][0] # Get the layout of the intial home screen.
+            deck.open()
+            open_decks.append(deck)
 
-        load_page(deck, HOME_PAGE["page_number"])
+            deck.reset()
 
-        # Register callback function for when a key state changes.
-        deck.set_key_callback(key_change_callback)
+            cache_deck_info(deck)
 
-        # Wait until all application threads have terminated (for this example,
-        # this is when all deck handles are closed).
-        for t in threading.enumerate():
-            try:
-                t.join()
-            except RuntimeError:
-                pass
+            print("Opened '{}' device (serial number: '{}', fw: '{}')".format(
+                deck.deck_type(), deck.get_serial_number(), deck.get_firmware_version()
+            ))
+
+            # Set initial screen brightness to 30%.
+            deck.set_brightness(30)
+
+            # Give the deck its own copy of the config, and prepare it for use.
+            load_deck_config(deck, DECK_CONFIG)
+            preload_icons(DECK_CONFIGS[deck]["page_index"]) # Decode all the icons used by the config.
+            prerender_key_images(deck, DECK_CONFIGS[deck]["page_index"]) # Render all the key images used by the config.
+
+            load_page(deck, DECK_CONFIGS[deck]["home_page"])
+
+            # Register callback function for when a key state changes.
+            deck.set_key_callback(key_change_callback)
+
+        # Wait until the application is requested to shut down, or until all the
+        # deck handles have been closed (e.g. due to the decks being unplugged).
+        while not SHUTDOWN.wait(timeout=1.0):
+            if not any(deck.is_open() for deck in open_decks):
+                break
+    finally:
+        for deck in open_decks:
+            if deck.is_open():
+                # Use a scoped-with on the deck to ensure we're the only thread
+                # using it right now.
+                with deck:
+                    # Reset deck, clearing all button images.
+                    deck.reset()
+
+                    # Close deck handle, terminating internal worker threads.
+                    deck.close()
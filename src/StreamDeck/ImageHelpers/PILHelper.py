@@ -51,25 +51,58 @@ def create_scaled_image(deck, image, margins=[0, 0, 0, 0], background='black'):
     :rtrype: PIL.Image
     :return: Loaded PIL image scaled and centered
     """
+    final_image = create_image(deck, background=background)
+
+    return paste_scaled_image(final_image, image, margins=margins)
+
+
+def paste_scaled_image(key_image, image, margins=[0, 0, 0, 0]):
+    """
+    Pastes a scaled version of a given image into an existing key image,
+    resized to best fit the key image with the given margins around each side.
+    This allows applications that generate many key images to reuse a single
+    key image, rather than creating a new one each time.
+
+    The scaled image is centered within the key image, offset by the given
+    margins. The aspect ratio of the image is preserved.
+
+    .. seealso:: See :func:`~PILHelper.create_scaled_image` method for creating
+                 a new key image containing a scaled image.
+
+    :param PIL.Image key_image: Key image to paste the scaled image into.
+    :param Image image: PIL Image object to scale
+    :param list(int): Array of margin pixels in (top, right, bottom, left) order.
+
+    :rtrype: PIL.Image
+    :return: Given key image, with the scaled image pasted into it
+    """
     from PIL import Image
 
     if len(margins) != 4:
         raise ValueError("Margins should be given as an array of four integers.")
 
-    final_image = create_image(deck, background=background)
-
-    thumbnail_max_width = final_image.width - (margins[1] + margins[3])
-    thumbnail_max_height = final_image.height - (margins[0] + margins[2])
-
-    thumbnail = image.convert("RGBA")
-    thumbnail.thumbnail((thumbnail_max_width, thumbnail_max_height), Image.LANCZOS)
+    thumbnail_max_width = key_image.width - (margins[1] + margins[3])
+    thumbnail_max_height = key_image.height - (margins[0] + margins[2])
+
+    # Scale RGB/RGBA images before converting them, so that the (expensive)
+    # resampling is done without an extra alpha channel where possible, and
+    # the conversion only needs to process the smaller scaled image. Other
+    # modes (such as palette images) must be converted first, as they cannot
+    # be resampled with a high quality filter.
+    if image.mode in ("RGB", "RGBA"):
+        thumbnail = image.copy()
+        thumbnail.thumbnail((thumbnail_max_width, thumbnail_max_height), Image.LANCZOS)
+        thumbnail = thumbnail.convert("RGBA")
+    else:
+        thumbnail = image.convert("RGBA")
+        thumbnail.thumbnail((thumbnail_max_width, thumbnail_max_height), Image.LANCZOS)
 
     thumbnail_x = (margins[3] + (thumbnail_max_width - thumbnail.width) // 2)
     thumbnail_y = (margins[0] + (thumbnail_max_height - thumbnail.height) // 2)
 
-    final_image.paste(thumbnail, (thumbnail_x, thumbnail_y), thumbnail)
+    key_image.paste(thumbnail, (thumbnail_x, thumbnail_y), thumbnail)
 
-    return final_image
+    return key_image
 
 
 def to_native_format(deck, image):
@@ -21,6 +21,8 @@ def test_pil_helpers(deck):
         return
 
     test_scaled_image = PILHelper.create_scaled_image(deck, Image.new("RGB", (1, 1)))     # noqa: F841
+    test_scaled_image = PILHelper.create_scaled_image(deck, Image.new("P", (1, 1)))     # noqa: F841
+    test_scaled_image = PILHelper.paste_scaled_image(PILHelper.create_image(deck), Image.new("RGB", (1, 1)))     # noqa: F841
 
     test_key_image = PILHelper.create_image(deck)
     test_key_image = PILHelper.to_native_format(deck, test_key_image)